@@ -2,6 +2,8 @@
 Entry point for ComfyUI to discover the Prompt History Gallery nodes.
 """
 
+from collections import OrderedDict
+
 from aiohttp import web
 from server import PromptServer
 
@@ -10,6 +12,8 @@ from .prompt_history_gallery import (
     NODE_DISPLAY_NAME_MAPPINGS,
     get_prompt_history_storage,
 )
+from .prompt_history_gallery.serialization import serialize_response
+from .prompt_history_gallery.storage import encode_list_cursor
 
 WEB_DIRECTORY = "./web"
 
@@ -20,30 +24,74 @@ __all__ = [
 ]
 
 
-def _serialize_entry(entry):
-    payload = entry.to_dict()
-    if not isinstance(payload.get("files"), list):
-        payload["files"] = []
-    return payload
+# Serialized listing bodies keyed by limit, each tagged with the storage generation.
+# Clients use one or two limits, so a few bodies suffice; the oldest is evicted first.
+_LIST_RESPONSE_CACHE = OrderedDict()
+_LIST_RESPONSE_CACHE_SIZE = 4
+
+
+def _list_body(storage, limit, after=None):
+    entries = storage.list(limit=limit, after=after)
+    # A full page may have a successor; the cursor is opaque to clients.
+    next_cursor = encode_list_cursor(entries[-1]) if len(entries) == limit else None
+    return serialize_response(
+        {"entries": [entry.to_dict() for entry in entries], "next_cursor": next_cursor}
+    )
+
+
+def _list_response_body(storage, limit):
+    generation = storage.generation
+    cached = _LIST_RESPONSE_CACHE.get(limit)
+    if cached is not None and cached[0] == generation:
+        _LIST_RESPONSE_CACHE.move_to_end(limit)
+        return cached[1]
+    body = _list_body(storage, limit)
+    # Drop bodies from older generations so the cache never outgrows one snapshot.
+    stale = [key for key, item in _LIST_RESPONSE_CACHE.items() if item[0] != generation]
+    for key in stale:
+        del _LIST_RESPONSE_CACHE[key]
+    _LIST_RESPONSE_CACHE[limit] = (generation, body)
+    while len(_LIST_RESPONSE_CACHE) > _LIST_RESPONSE_CACHE_SIZE:
+        _LIST_RESPONSE_CACHE.popitem(last=False)
+    return body
+
+
+# Clamped limits keyed by the raw query value and bounds; clients repeat the same few.
+_LIMIT_CACHE = {}
+_LIMIT_CACHE_SIZE = 32
 
 
 def _get_limit(request, *, default=50, minimum=20, maximum=1000):
     value = request.rel_url.query.get("limit")
-    if value is None:
-        return max(minimum, min(default, maximum))
+    key = (value, default, minimum, maximum)
+    cached = _LIMIT_CACHE.get(key)
+    if cached is not None:
+        return cached
     try:
-        limit = int(value)
+        limit = int(value) if value is not None else default
     except (TypeError, ValueError):
-        return max(minimum, min(default, maximum))
-    return max(minimum, min(limit, maximum))
+        limit = default
+    limit = max(minimum, min(limit, maximum))
+    if len(_LIMIT_CACHE) >= _LIMIT_CACHE_SIZE:
+        _LIMIT_CACHE.pop(next(iter(_LIMIT_CACHE)))
+    _LIMIT_CACHE[key] = limit
+    return limit
 
 
 @PromptServer.instance.routes.get("/prompt-history")
 async def list_prompt_history(request):
     storage = get_prompt_history_storage()
     limit = _get_limit(request)
-    entries = [_serialize_entry(entry) for entry in storage.list(limit=limit)]
-    return web.json_response({"entries": entries})
+    after = request.rel_url.query.get("after") or None
+    if after is not None:
+        # Page cursors are client-chosen, so they bypass the per-generation cache.
+        try:
+            body = _list_body(storage, limit, after)
+        except ValueError:
+            raise web.HTTPBadRequest(reason="Invalid page cursor") from None
+    else:
+        body = _list_response_body(storage, limit)
+    return web.Response(body=body, content_type="application/json", charset="utf-8")
 
 
 @PromptServer.instance.routes.delete("/prompt-history/{entry_id}")
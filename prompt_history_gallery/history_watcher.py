@@ -1,29 +1,54 @@
-"""Background polling loop for linking ComfyUI history with stored prompts."""
+"""Background watcher for linking ComfyUI history with stored prompts."""
 
 from __future__ import annotations
 
+import atexit
 import logging
 import threading
-import time
+from collections import OrderedDict
 from typing import Any, Dict, Optional, Tuple
 
-from .hooks import handle_prompt_completion
+from .hooks import handle_prompt_completion, install_task_done_hook
+from .storage import get_prompt_history_storage
 
 LOGGER = logging.getLogger(__name__)
 
 _POLL_INTERVAL_SECONDS = 0.5
+_WAKE_FALLBACK_SECONDS = 30.0
 _HISTORY_WINDOW = 512
+_STOP_JOIN_TIMEOUT_SECONDS = 2.0
 _WATCHER_LOCK = threading.Lock()
+_WAKE = threading.Condition()
+_WAKE_GENERATION = 0
+_PROMPT_SERVER_CLS: Optional[Any] = None
 
 
-def _resolve_prompt_queue() -> Tuple[Optional[Any], Optional[Any]]:
-    try:
-        from server import PromptServer  # type: ignore import-not-found
-    except Exception:
-        LOGGER.debug("PromptServer is not ready yet.", exc_info=True)
-        return None, None
+def notify_history_changed() -> None:
+    """Wake the watcher so freshly completed prompts are linked right away."""
+    global _WAKE_GENERATION
+    with _WAKE:
+        _WAKE_GENERATION += 1
+        _WAKE.notify_all()
+
+
+def _current_wake_generation() -> int:
+    with _WAKE:
+        return _WAKE_GENERATION
+
 
-    server = getattr(PromptServer, "instance", None)
+def _resolve_prompt_queue() -> Tuple[Optional[Any], Optional[Any]]:
+    global _PROMPT_SERVER_CLS
+    prompt_server = _PROMPT_SERVER_CLS
+    if prompt_server is None:
+        try:
+            from server import PromptServer as prompt_server  # type: ignore import-not-found
+        except Exception:
+            LOGGER.debug("PromptServer is not ready yet.", exc_info=True)
+            return None, None
+        # Cache the class so retries after queue errors skip the import machinery.
+        _PROMPT_SERVER_CLS = prompt_server
+
+    server = getattr(prompt_server, "instance", None)
     queue = getattr(server, "prompt_queue", None) if server else None
     return server, queue
 
@@ -58,6 +83,11 @@ class _HistoryWatcher:
         if poll_interval is not None:
             self.poll_interval = poll_interval
 
+        # Lock-free fast path for repeat calls; re-checked under the lock below.
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            return
+
         with _WATCHER_LOCK:
             if self._thread and self._thread.is_alive():
                 return
@@ -69,37 +99,72 @@ class _HistoryWatcher:
             )
             self._thread.start()
 
-    def stop(self) -> None:
+    def stop(self, timeout: Optional[float] = _STOP_JOIN_TIMEOUT_SECONDS) -> None:
         """
-        Signal the watcher to stop. Primarily useful for tests.
+        Signal the watcher to stop and wait briefly for the thread to exit.
+        Registered with ``atexit`` so shutdown does not race module teardown.
         """
         with _WATCHER_LOCK:
             self._stop_event.set()
+            thread = self._thread
             self._thread = None
+        notify_history_changed()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def _wait_for_change(self, seen_generation: int, timeout: float) -> None:
+        """
+        Block until a completion notification arrives, the watcher is stopped,
+        or the timeout elapses. Notifications sent while a scan was running are
+        not lost because they bump the generation counter.
+        """
+        with _WAKE:
+            _WAKE.wait_for(
+                lambda: self._stop_event.is_set() or _WAKE_GENERATION != seen_generation,
+                timeout,
+            )
 
     def _run(self) -> None:
-        processed_prompt_ids: set[str] = set()
+        # Insertion-ordered and capped at the history window, so ids that fell out
+        # of the window are evicted without a periodic set intersection.
+        processed_prompt_ids: "OrderedDict[str, None]" = OrderedDict()
         server: Optional[Any] = None
         queue: Optional[Any] = None
+        hooked = False
+        last_history_len = -1
+        last_tail_id: Optional[Any] = None
 
         while not self._stop_event.is_set():
+            seen_generation = _current_wake_generation()
             if queue is None:
                 server, queue = _resolve_prompt_queue()
                 if queue is None:
-                    self._stop_event.wait(self.poll_interval)
+                    self._wait_for_change(seen_generation, self.poll_interval)
                     continue
+                hooked = install_task_done_hook(queue, notify_history_changed)
+
+            # Fall back to plain polling when the completion hook is unavailable.
+            timeout = _WAKE_FALLBACK_SECONDS if hooked else self.poll_interval
 
             try:
                 history = queue.get_history(max_items=self.history_window)
                 if not isinstance(history, dict):
-                    self._stop_event.wait(self.poll_interval)
+                    self._wait_for_change(seen_generation, timeout)
+                    continue
+
+                # Skip the scan when the window looks identical to the last one.
+                history_len = len(history)
+                tail_id = next(reversed(history), None)
+                if history_len == last_history_len and tail_id == last_tail_id:
+                    self._wait_for_change(seen_generation, timeout)
                     continue
 
-                window_ids = set()
+                storage = get_prompt_history_storage()
                 for prompt_id_raw, payload in history.items():
-                    prompt_id = str(prompt_id_raw)
-                    window_ids.add(prompt_id)
+                    # ComfyUI keys history by str ids; only coerce anything else.
+                    prompt_id = prompt_id_raw if type(prompt_id_raw) is str else str(prompt_id_raw)
                     if prompt_id in processed_prompt_ids:
+                        processed_prompt_ids.move_to_end(prompt_id)
                         continue
 
                     prompt_payload = _extract_prompt_payload(payload)
@@ -109,20 +174,28 @@ class _HistoryWatcher:
                             payload,
                             prompt_payload,
                             server,
+                            storage,
                         )
                     except Exception:
                         LOGGER.exception("Failed to process prompt history entry %s", prompt_id)
-                    processed_prompt_ids.add(prompt_id)
+                    processed_prompt_ids[prompt_id] = None
+                    if len(processed_prompt_ids) > self.history_window:
+                        processed_prompt_ids.popitem(last=False)
 
-                processed_prompt_ids.intersection_update(window_ids)
+                last_history_len = history_len
+                last_tail_id = tail_id
             except Exception:
                 LOGGER.exception("Prompt history watcher encountered an error; retrying shortly.")
                 queue = None
+                hooked = False
+                last_history_len = -1
+                timeout = self.poll_interval
 
-            self._stop_event.wait(self.poll_interval)
+            self._wait_for_change(seen_generation, timeout)
 
 
 _WATCHER = _HistoryWatcher()
+atexit.register(_WATCHER.stop)
 
 
 def start_history_watcher(poll_interval: float = _POLL_INTERVAL_SECONDS) -> None:
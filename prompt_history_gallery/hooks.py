@@ -2,62 +2,79 @@
 
 from __future__ import annotations
 
+import functools
 import logging
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 
+from .models import OutputRecord
 from .normalizers import normalize_output_payload
 from .registry import consume_prompt_entries
-from .storage import get_prompt_history_storage
+from .storage import PromptHistoryStorage, get_prompt_history_storage
 
 LOGGER = logging.getLogger(__name__)
 
+_TASK_DONE_HOOK_ATTR = "_prompt_history_hooked"
+_PROMPT_NODE_CLASS = "PromptHistoryInput"
+_SAVED_OUTPUT_TYPE = "output"
+
 
 def _extract_generated_files(history_result: Any) -> List[Dict[str, Any]]:
     if not isinstance(history_result, dict):
         return []
 
     outputs = history_result.get("outputs")
-    if not isinstance(outputs, dict):
+    if not outputs or not isinstance(outputs, dict):
         return []
 
-    collected: List[Dict[str, Any]] = []
+    # Heuristic: If we have any "output" (saved) images, ignore "temp" (preview) images.
+    # This prevents intermediate controlnet previews from cluttering the history
+    # when a real save node is present. Both groups are split during collection.
+    saved: List[OutputRecord] = []
+    others: List[OutputRecord] = []
+    normalize = normalize_output_payload
+    saved_type = _SAVED_OUTPUT_TYPE
 
     for node_outputs in outputs.values():
-        if not isinstance(node_outputs, dict):
+        try:
+            get = node_outputs.get
+        except AttributeError:
             continue
-        for key in ("images", "files"):
-            entries = node_outputs.get(key)
+        images = get("images")
+        files = get("files")
+        if images is None and files is None:
+            continue
+        for entries in (images, files):
             if not isinstance(entries, list):
                 continue
             for entry in entries:
-                record = normalize_output_payload(entry)
-                if record:
-                    collected.append(record.to_dict())
+                record = normalize(entry)
+                if record is None:
+                    continue
+                if record.type == saved_type:
+                    saved.append(record)
+                elif not saved:
+                    others.append(record)
 
-    # Heuristic: If we have any "output" (saved) images, ignore "temp" (preview) images.
-    # This prevents intermediate controlnet previews from cluttering the history
-    # when a real save node is present.
-    has_saved_output = any(item.get("type") == "output" for item in collected)
-    if has_saved_output:
-        collected = [item for item in collected if item.get("type") == "output"]
-
-    return collected
+    return [record.to_dict() for record in (saved or others)]
 
 
 def _extract_prompt_texts(prompt_payload: Any) -> List[str]:
     if not isinstance(prompt_payload, dict):
         return []
+
+    target = _PROMPT_NODE_CLASS
     prompts: List[str] = []
+    append = prompts.append
     for node in prompt_payload.values():
-        if not isinstance(node, dict):
-            continue
-        if node.get("class_type") != "PromptHistoryInput":
+        # ComfyUI always emits dict nodes; malformed ones take the cold except path.
+        try:
+            if node["class_type"] != target:
+                continue
+            prompt_value = node["inputs"]["prompt"]
+        except (KeyError, TypeError):
             continue
-        inputs = node.get("inputs", {})
-        if isinstance(inputs, dict):
-            prompt_value = inputs.get("prompt")
-            if isinstance(prompt_value, str) and prompt_value:
-                prompts.append(prompt_value)
+        if isinstance(prompt_value, str) and prompt_value:
+            append(prompt_value)
     return prompts
 
 
@@ -87,9 +104,11 @@ def _notify_clients(
     if server is None or not entry_ids:
         return
     try:
-        payload: Dict[str, Any] = {"entry_ids": list(entry_ids)}
+        # Ownership of both lists passes to the server, which serializes the
+        # message later on its event loop; callers must not mutate them afterwards.
+        payload: Dict[str, Any] = {"entry_ids": entry_ids}
         if files:
-            payload["files"] = [dict(item) for item in files]
+            payload["files"] = files
         server.send_sync("PromptHistoryGallery.updated", payload)
     except Exception:  # pragma: no cover
         LOGGER.exception("Failed to notify clients about history update")
@@ -100,8 +119,15 @@ def handle_prompt_completion(
     history_result: Any,
     prompt_payload: Any,
     server: Optional[Any],
+    storage: Optional[PromptHistoryStorage] = None,
 ) -> None:
-    storage = get_prompt_history_storage()
+    """
+    Link a finished prompt to its history entries, store its outputs and notify
+    clients. The resolved id and file lists are handed to the client message as-is.
+    Callers processing many prompts can pass ``storage`` to skip the singleton lookup.
+    """
+    if storage is None:
+        storage = get_prompt_history_storage()
 
     entry_ids = _resolve_entry_ids(prompt_id, prompt_payload, storage)
     if not entry_ids:
@@ -109,8 +135,7 @@ def handle_prompt_completion(
 
     # Store the full prompt payload in metadata for later use
     if prompt_payload:
-        for entry_id in entry_ids:
-            storage.update_metadata(entry_id, {"comfyui_prompt": prompt_payload})
+        storage.update_metadata_bulk(tuple(entry_ids), {"comfyui_prompt": prompt_payload})
 
     files = _extract_generated_files(history_result)
     if files:
@@ -118,3 +143,33 @@ def handle_prompt_completion(
 
     storage.touch_entries(entry_ids)
     _notify_clients(server, entry_ids, files)
+
+
+def install_task_done_hook(queue: Any, callback: Callable[[], None]) -> bool:
+    """
+    Wrap ``queue.task_done`` so ``callback`` fires after every completed prompt.
+    Returns True when the hook is in place.
+    """
+    task_done = getattr(queue, "task_done", None)
+    if not callable(task_done):
+        return False
+    if getattr(task_done, _TASK_DONE_HOOK_ATTR, False):
+        return True
+
+    @functools.wraps(task_done)
+    def _wrap_task_done(*args: Any, **kwargs: Any) -> Any:
+        try:
+            return task_done(*args, **kwargs)
+        finally:
+            try:
+                callback()
+            except Exception:  # pragma: no cover
+                LOGGER.exception("Prompt completion callback failed")
+
+    setattr(_wrap_task_done, _TASK_DONE_HOOK_ATTR, True)
+    try:
+        queue.task_done = _wrap_task_done
+    except Exception:
+        LOGGER.debug("Unable to hook prompt queue completion.", exc_info=True)
+        return False
+    return True
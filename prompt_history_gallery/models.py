@@ -3,12 +3,18 @@
 from __future__ import annotations
 
 from dataclasses import dataclass, field
-from typing import Any, Dict, Sequence, Tuple
+from typing import Any, Dict, Optional, Sequence, Tuple
 
 from .serialization import deserialize_metadata
 
 
-@dataclass(frozen=True)
+def _file_dict(item: Any) -> Dict[str, Any]:
+    if hasattr(item, "to_dict"):
+        return item.to_dict()
+    return item if isinstance(item, dict) else dict(item)
+
+
+@dataclass(frozen=True, slots=True)
 class PromptHistoryEntry:
     """Serializable prompt history item."""
 
@@ -24,11 +30,17 @@ class PromptHistoryEntry:
         cls,
         row: Any,
         files: Sequence[Any] = (),
+        metadata: Optional[Dict[str, Any]] = None,
     ) -> "PromptHistoryEntry":
-        metadata = deserialize_metadata(row["metadata"])
-        normalized_files: Tuple[Dict[str, Any], ...] = tuple(
-            item.to_dict() if hasattr(item, "to_dict") else dict(item) for item in files
-        )
+        """
+        Build an entry from a database row. Pass ``metadata`` when the row's
+        metadata column has already been parsed to skip decoding it again.
+        """
+        if metadata is None:
+            metadata = deserialize_metadata(row["metadata"])
+        # Files keep the caller's dicts instead of copies, so treat them as read-only;
+        # to_dict() makes the single copy at the serialization boundary.
+        normalized_files: Tuple[Dict[str, Any], ...] = tuple(_file_dict(item) for item in files)
         return cls(
             id=row["id"],
             created_at=row["created_at"],
@@ -39,18 +51,21 @@ class PromptHistoryEntry:
         )
 
     def to_dict(self) -> Dict[str, Any]:
-        """Convert the dataclass into a JSON serialisable dictionary."""
+        """
+        Convert the dataclass into a JSON serialisable dictionary.
+        ``files`` is always emitted as a list.
+        """
         return {
             "id": self.id,
             "created_at": self.created_at,
             "prompt": self.prompt,
             "metadata": self.metadata.copy(),
             "last_used_at": self.last_used_at,
-            "files": [item.copy() for item in self.files],
+            "files": [dict(item) for item in self.files],
         }
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class OutputRecord:
     """Normalized representation of a generated file linked to a prompt entry."""
 
@@ -4,7 +4,7 @@ Prompt input node that records text prompts into history storage.
 
 from __future__ import annotations
 
-import time
+import weakref
 from typing import Any, Dict, Optional, Tuple
 
 from comfy_execution.utils import get_executing_context
@@ -14,6 +14,9 @@ from ..registry import register_prompt_entry
 from ..storage import get_prompt_history_storage
 
 _NODE_METADATA_KEY = "_prompt_history_node"
+# ComfyUI's ExecutionContext exposes node_id, so the first probe normally wins.
+_CONTEXT_ID_ATTRIBUTES = ("node_id", "node_index", "node_identifier", "node_ref")
+_NODE_ID_KEYS = ("id", "name", "title")
 
 
 def _resolve_node_identifier(context: Any) -> Optional[str]:
@@ -23,7 +26,7 @@ def _resolve_node_identifier(context: Any) -> Optional[str]:
     if context is None:
         return None
 
-    for attribute in ("node_id", "node_index", "node_identifier", "node_ref"):
+    for attribute in _CONTEXT_ID_ATTRIBUTES:
         value = getattr(context, attribute, None)
         if value is not None:
             return str(value)
@@ -33,13 +36,13 @@ def _resolve_node_identifier(context: Any) -> Optional[str]:
         return None
 
     if isinstance(node, dict):
-        for key in ("id", "name", "title"):
+        for key in _NODE_ID_KEYS:
             value = node.get(key)
             if value is not None:
                 return str(value)
         return None
 
-    for attribute in ("id", "name", "title"):
+    for attribute in _NODE_ID_KEYS:
         value = getattr(node, attribute, None)
         if value is not None:
             return str(value)
@@ -54,6 +57,8 @@ class PromptHistoryInput:
 
     def __init__(self) -> None:
         self._storage = get_prompt_history_storage()
+        # (weakref to CLIP, prompt, conditioning) from the last encode of this node.
+        self._last_encoding: Optional[Tuple[Any, str, Any]] = None
 
     @classmethod
     def INPUT_TYPES(cls):
@@ -97,9 +102,27 @@ class PromptHistoryInput:
             self._storage.touch_entries([entry.id])
         if prompt_id:
             register_prompt_entry(prompt_id, entry.id)
+        return (self._encode(clip, prompt),)
+
+    def _encode(self, clip, prompt: str) -> Any:
+        """
+        Encode the prompt, reusing the previous conditioning when neither the
+        CLIP object nor the text changed since the last run of this node.
+        """
+        cached = self._last_encoding
+        if cached is not None:
+            clip_ref, cached_prompt, conditioning = cached
+            if cached_prompt == prompt and clip_ref() is clip:
+                return conditioning
+
         tokens = clip.tokenize(prompt)
         conditioning = clip.encode_from_tokens_scheduled(tokens)
-        return (conditioning,)
+        try:
+            # Weak reference so a replaced CLIP model is not kept alive by the cache.
+            self._last_encoding = (weakref.ref(clip), prompt, conditioning)
+        except TypeError:
+            self._last_encoding = None
+        return conditioning
 
     @classmethod
     def IS_CHANGED(
@@ -110,6 +133,7 @@ class PromptHistoryInput:
     ):
         """
         Force the node to execute on every graph run so that the prompt history
-        captures repeated prompts (e.g. unchanged negative prompts).
+        captures repeated prompts (e.g. unchanged negative prompts). NaN never
+        compares equal to the cached value, so no clock read is needed.
         """
-        return time.time()
+        return float("nan")
@@ -25,6 +25,13 @@ def normalize_metadata(raw: Any) -> Dict[str, Any]:
     return {}
 
 
+def _clean_text(value: Any) -> str:
+    # Plain strings, the common case, skip the str() conversion.
+    if type(value) is str:
+        return value.strip()
+    return str(value).strip() if value else ""
+
+
 def normalize_output_payload(file_info: Any) -> Optional[OutputRecord]:
     """
     Accept loose file payloads from ComfyUI and convert to OutputRecord.
@@ -36,15 +43,15 @@ def normalize_output_payload(file_info: Any) -> Optional[OutputRecord]:
         return OutputRecord(filename=filename)
 
     if isinstance(file_info, dict):
-        filename_raw = file_info.get("filename")
-        if not filename_raw:
-            return None
-        filename = str(filename_raw).strip()
+        get = file_info.get
+        filename = _clean_text(get("filename"))
         if not filename:
             return None
-        subfolder = str(file_info.get("subfolder", "") or "").strip()
-        output_type = str(file_info.get("type") or file_info.get("kind") or "").strip()
-        return OutputRecord(filename=filename, subfolder=subfolder, type=output_type)
+        return OutputRecord(
+            filename=filename,
+            subfolder=_clean_text(get("subfolder")),
+            type=_clean_text(get("type") or get("kind")),
+        )
 
     return None
 
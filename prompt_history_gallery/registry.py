@@ -3,18 +3,28 @@
 from __future__ import annotations
 
 import threading
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
-_PROMPT_ENTRY_REGISTRY: Dict[str, List[str]] = {}
-_REGISTRY_LOCK = threading.Lock()
+# Each prompt id always maps to the same shard, so per-shard locks keep the
+# register/consume pairing intact while concurrent prompts rarely contend.
+_SHARD_COUNT = 16
+_SHARD_MASK = _SHARD_COUNT - 1
+_REGISTRY_SHARDS: Tuple[Tuple[Dict[str, List[str]], threading.Lock], ...] = tuple(
+    ({}, threading.Lock()) for _ in range(_SHARD_COUNT)
+)
+
+
+def _shard_for(prompt_id: str) -> Tuple[Dict[str, List[str]], threading.Lock]:
+    return _REGISTRY_SHARDS[hash(prompt_id) & _SHARD_MASK]
 
 
 def register_prompt_entry(prompt_id: Optional[str], entry_id: str) -> None:
     """Track prompt executions so generated files can be linked later."""
     if not prompt_id:
         return
-    with _REGISTRY_LOCK:
-        bucket = _PROMPT_ENTRY_REGISTRY.setdefault(prompt_id, [])
+    registry, lock = _shard_for(prompt_id)
+    with lock:
+        bucket = registry.setdefault(prompt_id, [])
         bucket.append(entry_id)
 
 
@@ -22,5 +32,6 @@ def consume_prompt_entries(prompt_id: Optional[str]) -> List[str]:
     """Retrieve and clear pending entries for the given prompt id."""
     if not prompt_id:
         return []
-    with _REGISTRY_LOCK:
-        return _PROMPT_ENTRY_REGISTRY.pop(prompt_id, [])
+    registry, lock = _shard_for(prompt_id)
+    with lock:
+        return registry.pop(prompt_id, [])
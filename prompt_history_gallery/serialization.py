@@ -3,24 +3,89 @@
 from __future__ import annotations
 
 import json
-from typing import Any, Dict
+from typing import Any, Dict, List, Sequence
+
+try:  # Optional C accelerator; the stdlib encoder/decoder is the fallback.
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
 
 
 def serialize_metadata(metadata: Dict[str, Any]) -> str:
-    """Serialize metadata dict to JSON for storage."""
-    return json.dumps(metadata, ensure_ascii=False, sort_keys=True)
+    """
+    Serialize metadata dict to canonical (key-sorted, compact) JSON for storage.
+    Entries are matched by a hash of this text, so it always comes from the stdlib
+    encoder: orjson formats floats differently (1e+16 vs 1e16) and drops NaN to null,
+    which would make dedup depend on whether the optional dependency is installed.
+    """
+    return json.dumps(metadata, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+def serialize_values(values: Sequence[Any]) -> str:
+    """
+    Serialize a flat sequence of JSON scalars, e.g. ids bound to a json_each() parameter.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(list(values)).decode("utf-8")
+        except TypeError:
+            pass
+    return json.dumps(list(values), ensure_ascii=False, separators=(",", ":"))
+
+
+def serialize_response(payload: Any) -> bytes:
+    """
+    Encode an API response body as compact UTF-8 JSON. Key order is left as built.
+    orjson writes non-finite floats as null, which browsers can parse; the stdlib
+    fallback keeps its NaN/Infinity literals.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # e.g. integers wider than 64 bits in stored workflows
+            pass
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _loads(raw: Any) -> Any:
+    if orjson is not None:
+        try:
+            return orjson.loads(raw)
+        except ValueError:
+            # orjson rejects NaN/Infinity, which older rows written by stdlib may contain.
+            pass
+    return json.loads(raw)
 
 
 def deserialize_metadata(raw: Any) -> Dict[str, Any]:
-    """Coerce stored metadata into a dictionary."""
+    """
+    Coerce stored metadata into a dictionary.
+    """
     if isinstance(raw, dict):
         return dict(raw)
-    if isinstance(raw, str):
+    if isinstance(raw, (str, bytes)):
         if not raw:
             return {}
         try:
-            parsed = json.loads(raw)
+            parsed = _loads(raw)
         except (TypeError, ValueError):
             return {}
         return dict(parsed) if isinstance(parsed, dict) else {}
     return {}
+
+
+def deserialize_records(raw: Any) -> List[Dict[str, Any]]:
+    """
+    Decode a stored JSON array of objects, such as aggregated output rows.
+    Non-object items are dropped; malformed input yields an empty list.
+    """
+    if not raw:
+        return []
+    try:
+        parsed = _loads(raw)
+    except (TypeError, ValueError):
+        return []
+    if not isinstance(parsed, list):
+        return []
+    return [item for item in parsed if isinstance(item, dict)]
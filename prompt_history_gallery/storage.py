@@ -4,18 +4,33 @@ Helpers for persisting prompt history entries using SQLite.
 
 from __future__ import annotations
 
+import atexit
+import base64
+import binascii
+import hashlib
+import json
+import logging
 import os
+import queue
+import secrets
 import sqlite3
 import threading
-import uuid
+import time
+import weakref
 from contextlib import contextmanager
-from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
 
 from .models import OutputRecord, PromptHistoryEntry
 from .normalizers import normalize_metadata, normalize_output_payload
-from .serialization import deserialize_metadata, serialize_metadata
+from .serialization import (
+    deserialize_metadata,
+    deserialize_records,
+    serialize_metadata,
+    serialize_values,
+)
+
+LOGGER = logging.getLogger(__name__)
 
 
 def _default_storage_directory() -> Path:
@@ -36,58 +51,339 @@ def _ensure_directory(path: Path) -> None:
     path.mkdir(parents=True, exist_ok=True)
 
 
-T = TypeVar("T")
+# The journal mode is persistent, so only the writer connection sets it.
+_WRITER_PRAGMAS = (
+    "PRAGMA journal_mode=WAL;",
+    "PRAGMA synchronous=NORMAL;",
+)
+# Page size only takes effect on a database with no pages yet, and must precede WAL.
+_NEW_DATABASE_PAGE_SIZE = 8192
+# Backs up mode=ro at the SQL level: pooled readers reject writes outright.
+_READER_PRAGMAS = ("PRAGMA query_only=1;",)
+# Up to 256 MiB of the database is memory-mapped for reads, the page cache is capped
+# at ~20 MB, temp B-trees stay in RAM and writers wait up to 5s on a locked database.
+_CONNECTION_PRAGMAS = (
+    "PRAGMA mmap_size=268435456;",
+    "PRAGMA cache_size=-20000;",
+    "PRAGMA temp_store=MEMORY;",
+    "PRAGMA busy_timeout=5000;",
+)
+
+# Hot-path statements live at module scope so every call hands sqlite3 the same text
+# and reuses the compiled statement from the connection's cache.
+_SQL_INSERT_ENTRY = """
+    INSERT INTO prompt_history
+        (id, created_at, last_used_at, prompt, tags, metadata, content_hash)
+    VALUES
+        (:id, :created_at, :last_used_at, :prompt, :tags, :metadata, :content_hash)
+"""
+_SQL_FIND_BY_HASH = """
+    SELECT id, created_at, last_used_at, prompt, metadata
+    FROM prompt_history
+    WHERE content_hash = ?
+    ORDER BY last_used_at DESC
+    LIMIT 1
+"""
+_SQL_UPDATE_METADATA = "UPDATE prompt_history SET metadata = ?, content_hash = ? WHERE id = ?"
+# Distinct prompts come from one pass over idx_prompt_history_prompt, and each prompt's
+# latest row is an index seek. Every prompt's latest row is still visited and sorted
+# before the LIMIT, so the inner query keeps only the sort key and rowid; metadata is
+# read afterwards for the rows on the page.
+_SQL_LATEST_PER_PROMPT_TEMPLATE = (
+    "SELECT latest_row.id, latest_row.created_at, latest_row.last_used_at, "
+    "latest_row.prompt, latest_row.metadata FROM ("
+    "SELECT p.rowid AS row_id "
+    "FROM (SELECT prompt FROM prompt_history GROUP BY prompt) AS grouped "
+    "JOIN prompt_history p ON p.rowid = ("
+    "SELECT rowid FROM prompt_history WHERE prompt = grouped.prompt "
+    "ORDER BY last_used_at DESC, created_at DESC, id DESC LIMIT 1"
+    "){after} "
+    "ORDER BY p.last_used_at DESC, p.created_at DESC, p.id DESC{limit}"
+    ") AS page "
+    "JOIN prompt_history latest_row ON latest_row.rowid = page.row_id"
+)
+# Outputs of every entry sharing the prompt are aggregated into one JSON array per
+# listed row. json_patch drops the NULLIF'd keys so records keep the compact wire shape.
+# The metadata of those entries comes back as an object of still-serialized strings,
+# so malformed or NaN-bearing rows decode leniently in Python as they always have.
+# The limit applies before the correlated subquery so only returned rows pay for it.
+_SQL_LIST_TEMPLATE = (
+    "SELECT latest.id, latest.created_at, latest.last_used_at, latest.prompt, "
+    "latest.metadata, ("
+    "SELECT json_group_array(json_patch("
+    "json_object('filename', filename), "
+    "json_object("
+    "'subfolder', NULLIF(subfolder, ''), "
+    "'type', NULLIF(type, ''), "
+    "'entry_id', NULLIF(entry_id, '')"
+    ")"
+    ")) FROM ("
+    "SELECT o.entry_id, o.filename, o.subfolder, o.type "
+    "FROM prompt_history_output o "
+    "JOIN prompt_history p ON p.id = o.entry_id "
+    "WHERE p.prompt = latest.prompt ORDER BY o.id"
+    ")"
+    ") AS files_json, ("
+    "SELECT json_group_object(e.id, e.metadata) "
+    "FROM prompt_history e "
+    "WHERE e.prompt = latest.prompt AND EXISTS ("
+    "SELECT 1 FROM prompt_history_output o WHERE o.entry_id = e.id"
+    ")"
+    ") AS entry_metadata_json "
+    "FROM ({latest}) AS latest "
+    "ORDER BY latest.last_used_at DESC, latest.created_at DESC, latest.id DESC"
+)
+# Keyed by (paged, limited). The keyset cursor compares the full sort key as a row value,
+# because touch_entries stamps whole batches with one timestamp and ties are common.
+_SQL_LIST_VARIANTS = {
+    (paged, limited): _SQL_LIST_TEMPLATE.format(
+        latest=_SQL_LATEST_PER_PROMPT_TEMPLATE.format(
+            after=" WHERE (p.last_used_at, p.created_at, p.id) < (?, ?, ?)" if paged else "",
+            limit=" LIMIT ?" if limited else "",
+        )
+    )
+    for paged in (False, True)
+    for limited in (False, True)
+}
+_SQL_INSERT_OUTPUT = """
+    INSERT OR IGNORE INTO prompt_history_output
+        (entry_id, filename, subfolder, type)
+    VALUES
+        (?, ?, ?, ?)
+"""
+# Outputs go with their entries through ON DELETE CASCADE.
+_SQL_DELETE_PROMPT_OF_ENTRY = (
+    "DELETE FROM prompt_history WHERE prompt = (SELECT prompt FROM prompt_history WHERE id = ?)"
+)
+
+# Id/prompt lists are bound as one JSON array parameter and expanded with json_each,
+# so each statement has a single SQL text regardless of batch size and needs no chunking
+# to stay under SQLite's bound-variable limit. The IN (SELECT ...) still seeks the index.
+_SQL_SELECT_METADATA_BY_IDS = (
+    "SELECT id, prompt, metadata FROM prompt_history WHERE id IN (SELECT value FROM json_each(?))"
+)
+_SQL_TOUCH_BY_IDS = (
+    "UPDATE prompt_history SET last_used_at = ? WHERE id IN (SELECT value FROM json_each(?))"
+)
+# The most recently used row per prompt is picked in SQL, walking
+# idx_prompt_history_prompt in its stored order.
+_SQL_LATEST_IDS_FOR_PROMPTS = (
+    "SELECT prompt, id FROM ("
+    "SELECT prompt, id, ROW_NUMBER() OVER ("
+    "PARTITION BY prompt ORDER BY last_used_at DESC, created_at DESC"
+    ") AS row_rank "
+    "FROM prompt_history WHERE prompt IN (SELECT value FROM json_each(?))"
+    ") WHERE row_rank = 1"
+)
+
+# Rows pulled per fetchmany() while streaming listings.
+_LIST_FETCH_SIZE = 64
+
+# Headroom over the driver default of 128 compiled statements.
+_CACHED_STATEMENTS = 256
+
+# Idle read-only connections kept for reuse; extra concurrent readers open their own
+# connection and close it afterwards.
+_READ_POOL_SIZE = 4
+
+
+def _content_hash(prompt: str, serialized_metadata: str) -> str:
+    """
+    Digest identifying a (prompt, metadata) pair; metadata must be canonical JSON.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(prompt.encode("utf-8"))
+    digest.update(b"\x00")
+    digest.update(serialized_metadata.encode("utf-8"))
+    return digest.hexdigest()
+
+
+# Fields of the list() sort key, in ORDER BY order, carried by page cursors.
+_CURSOR_FIELDS = ("last_used_at", "created_at", "id")
+
+
+def encode_list_cursor(entry: PromptHistoryEntry) -> str:
+    """
+    Opaque page cursor for list(after=...) that resumes right after ``entry``.
+    """
+    key = json.dumps([getattr(entry, field) for field in _CURSOR_FIELDS], separators=(",", ":"))
+    return base64.urlsafe_b64encode(key.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_list_cursor(cursor: str) -> Tuple[str, ...]:
+    """
+    Recover the sort key of a page cursor; raises ValueError when it is malformed.
+    """
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        key = None
+    if (
+        not isinstance(key, list)
+        or len(key) != len(_CURSOR_FIELDS)
+        or not all(isinstance(value, str) for value in key)
+    ):
+        raise ValueError("Malformed page cursor")
+    return tuple(key)
+
+
+def _new_entry_id() -> str:
+    """
+    Time-ordered id: 12 hex digits of milliseconds since the epoch plus 80 random bits.
+    New rows land at the end of the primary-key B-tree instead of at random pages.
+    """
+    return f"{time.time_ns() // 1_000_000:012x}{secrets.token_hex(10)}"
+
+
+# (epoch second, formatted date/time) of the last timestamp; rebuilt once per second.
+_TIMESTAMP_PREFIX: Tuple[int, str] = (-1, "")
 
 
-def _chunked(values: Sequence[T], chunk_size: int) -> Iterator[Sequence[T]]:
-    for idx in range(0, len(values), chunk_size):
-        yield values[idx : idx + chunk_size]
+def _utc_now_iso() -> str:
+    """
+    Current UTC time as datetime.isoformat() writes it, always with microseconds.
+    The date/time part is only reformatted when the second changes.
+    """
+    global _TIMESTAMP_PREFIX
+    seconds, micros = divmod(time.time_ns() // 1000, 1_000_000)
+    cached_seconds, prefix = _TIMESTAMP_PREFIX
+    if cached_seconds != seconds:
+        prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(seconds))
+        _TIMESTAMP_PREFIX = (seconds, prefix)
+    return f"{prefix}.{micros:06d}+00:00"
+
+
+# Open storages get PRAGMA optimize at interpreter exit. The set holds them weakly, so
+# one module-level hook serves every instance without keeping any of them alive.
+_OPEN_STORAGES: "weakref.WeakSet[PromptHistoryStorage]" = weakref.WeakSet()
+
+
+@atexit.register
+def _optimize_open_storages() -> None:
+    for storage in list(_OPEN_STORAGES):
+        storage._optimize()
 
 
 class PromptHistoryStorage:
     """
     SQLite-backed storage with coarse locking to prevent corruption.
+    Writes share one connection behind the lock; reads use pooled read-only
+    connections so WAL lets them proceed while a write is in progress.
     """
 
-    _FALLBACK_LOOKUP_LIMIT = 25
-
     def __init__(self, storage_file: Optional[Path] = None) -> None:
         if storage_file is None:
             storage_file = _default_storage_directory() / "prompt_history.db"
         self._file_path = storage_file
         _ensure_directory(self._file_path.parent)
         self._lock = threading.RLock()
-        self._connection = sqlite3.connect(self._file_path, check_same_thread=False)
+        self._generation = 0
+        # Transactions are managed explicitly in _locked_cursor, so the driver's
+        # implicit BEGIN handling is disabled.
+        self._connection = sqlite3.connect(
+            self._file_path,
+            check_same_thread=False,
+            isolation_level=None,
+            cached_statements=_CACHED_STATEMENTS,
+        )
         self._connection.row_factory = sqlite3.Row
         self._connection.execute("PRAGMA foreign_keys = ON;")
+        self._configure_connection(self._connection, writer=True)
         self._configure_database()
+        self._read_pool: "queue.Queue[sqlite3.Connection]" = queue.Queue(_READ_POOL_SIZE)
+        self._closed = False
+        _OPEN_STORAGES.add(self)
+
+    @property
+    def generation(self) -> int:
+        """
+        Monotonic counter bumped after every committed write.
+        Lets callers cache derived data until the stored history changes.
+        """
+        return self._generation
 
     @contextmanager
     def _locked_cursor(self, *, commit: bool = False) -> Iterator[sqlite3.Cursor]:
         """
         Provide a cursor guarded by the storage lock.
-        Optionally commits the transaction on successful exit.
+        With commit=True the block runs in a BEGIN IMMEDIATE transaction, taking the
+        write lock up front instead of upgrading mid-transaction under WAL readers.
         """
         with self._lock:
             cursor = self._connection.cursor()
+            # Nested write blocks join the enclosing transaction.
+            owns_transaction = commit and not self._connection.in_transaction
+            if owns_transaction:
+                cursor.execute("BEGIN IMMEDIATE")
             try:
                 yield cursor
-                if commit:
-                    self._connection.commit()
-            except Exception:
-                if commit:
-                    self._connection.rollback()
+                if owns_transaction:
+                    cursor.execute("COMMIT")
+                    self._generation += 1
+            except BaseException:
+                # KeyboardInterrupt and friends included: a transaction left open here
+                # would be silently joined, and never committed, by every later block.
+                if owns_transaction and self._connection.in_transaction:
+                    cursor.execute("ROLLBACK")
                 raise
 
+    def _open_read_connection(self) -> sqlite3.Connection:
+        uri = self._file_path.resolve().as_uri() + "?mode=ro"
+        connection = sqlite3.connect(
+            uri,
+            uri=True,
+            check_same_thread=False,
+            isolation_level=None,
+            cached_statements=_CACHED_STATEMENTS,
+        )
+        # Read queries unpack plain tuples positionally; see the column order of each query.
+        connection.row_factory = None
+        self._configure_connection(connection, writer=False)
+        return connection
+
+    @contextmanager
+    def _read_cursor(self) -> Iterator[sqlite3.Cursor]:
+        """
+        Provide a cursor on a read-only connection without taking the storage lock.
+        The block runs in one read transaction, so every query sees the same snapshot.
+        """
+        if self._closed:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed storage.")
+        try:
+            connection = self._read_pool.get_nowait()
+        except queue.Empty:
+            connection = self._open_read_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute("BEGIN")
+            yield cursor
+        finally:
+            # Also reached when a streaming caller abandons iter_entries() early.
+            try:
+                if connection.in_transaction:
+                    connection.execute("COMMIT")
+            except sqlite3.Error:
+                connection.close()
+            else:
+                # A read that outlives close() must not hand its connection back.
+                if self._closed:
+                    connection.close()
+                else:
+                    try:
+                        self._read_pool.put_nowait(connection)
+                    except queue.Full:
+                        connection.close()
+
     def _create_entry_locked(
         self,
         cursor: sqlite3.Cursor,
         prompt: str,
         metadata: Dict[str, Any],
+        serialized_metadata: str,
     ) -> PromptHistoryEntry:
-        now_iso = datetime.now(timezone.utc).isoformat()
+        now_iso = _utc_now_iso()
         entry = PromptHistoryEntry(
-            id=str(uuid.uuid4()),
+            id=_new_entry_id(),
             created_at=now_iso,
             prompt=prompt,
             metadata=metadata.copy(),
@@ -95,17 +391,15 @@ class PromptHistoryStorage:
             files=tuple(),
         )
         cursor.execute(
-            """
-            INSERT INTO prompt_history (id, created_at, last_used_at, prompt, tags, metadata)
-            VALUES (:id, :created_at, :last_used_at, :prompt, :tags, :metadata)
-            """,
+            _SQL_INSERT_ENTRY,
             {
                 "id": entry.id,
                 "created_at": entry.created_at,
                 "last_used_at": entry.last_used_at,
                 "prompt": entry.prompt,
                 "tags": "[]",  # Legacy column
-                "metadata": serialize_metadata(entry.metadata),
+                "metadata": serialized_metadata,
+                "content_hash": _content_hash(entry.prompt, serialized_metadata),
             },
         )
         return entry
@@ -114,49 +408,21 @@ class PromptHistoryStorage:
         self,
         cursor: sqlite3.Cursor,
         prompt: str,
-        metadata: Dict[str, Any],
+        serialized_metadata: str,
     ) -> Optional[PromptHistoryEntry]:
         """
         Attempt to find an existing entry that matches the provided payload.
+        Matches on the indexed content hash of prompt + canonical metadata.
         """
-
-        # First try exact match (fast path, though less likely now with ignored keys)
-        payload = {
-            "prompt": prompt,
-            "metadata": serialize_metadata(metadata),
-        }
         # Note: We ignore tags in search now
         row = cursor.execute(
-            """
-            SELECT id, created_at, last_used_at, prompt, metadata
-            FROM prompt_history
-            WHERE prompt = :prompt AND metadata = :metadata
-            ORDER BY last_used_at DESC
-            LIMIT 1
-            """,
-            payload,
+            _SQL_FIND_BY_HASH,
+            (_content_hash(prompt, serialized_metadata),),
         ).fetchone()
-        if row is not None:
-            return PromptHistoryEntry.from_row(row)
-
-        # Fallback: find by prompt and manually check metadata
-        fallback_rows = cursor.execute(
-            """
-            SELECT id, created_at, last_used_at, prompt, metadata
-            FROM prompt_history
-            WHERE prompt = ?
-            ORDER BY last_used_at DESC, created_at DESC
-            LIMIT ?
-            """,
-            (prompt, self._FALLBACK_LOOKUP_LIMIT),
-        ).fetchall()
-
-        for candidate_row in fallback_rows:
-            candidate_entry = PromptHistoryEntry.from_row(candidate_row)
-            if candidate_entry.metadata == metadata:
-                return candidate_entry
-
-        return None
+        # The prompt check only guards against digest collisions.
+        if row is None or row["prompt"] != prompt:
+            return None
+        return PromptHistoryEntry.from_row(row)
 
     def append(
         self,
@@ -166,11 +432,13 @@ class PromptHistoryStorage:
     ) -> PromptHistoryEntry:
         """Persist a new entry for the provided prompt text."""
         incoming_metadata = normalize_metadata(metadata)
+        serialized_metadata = serialize_metadata(incoming_metadata)
         with self._locked_cursor(commit=True) as cursor:
             entry = self._create_entry_locked(
                 cursor,
                 prompt,
                 incoming_metadata,
+                serialized_metadata,
             )
         return entry
 
@@ -185,94 +453,127 @@ class PromptHistoryStorage:
         Returns the entry and a flag indicating whether it was newly created.
         """
         incoming_metadata = normalize_metadata(metadata)
+        # Serialized once: the lookup hash and the inserted row share the same text.
+        serialized_metadata = serialize_metadata(incoming_metadata)
         with self._locked_cursor(commit=True) as cursor:
-            existing = self._find_entry_locked(cursor, prompt, incoming_metadata)
+            existing = self._find_entry_locked(cursor, prompt, serialized_metadata)
             if existing is not None:
                 return existing, False
-            entry = self._create_entry_locked(cursor, prompt, incoming_metadata)
+            entry = self._create_entry_locked(
+                cursor, prompt, incoming_metadata, serialized_metadata
+            )
             return entry, True
 
     def update_metadata(self, entry_id: str, metadata_update: Dict[str, Any]) -> None:
         """
         Update the metadata of an existing entry.
         """
-        if not entry_id or not metadata_update:
+        if not entry_id:
             return
+        self.update_metadata_bulk((entry_id,), metadata_update)
 
-        with self._locked_cursor(commit=True) as cursor:
-            row = cursor.execute(
-                "SELECT metadata FROM prompt_history WHERE id = ?", (entry_id,)
-            ).fetchone()
-            if not row:
-                return
+    def update_metadata_bulk(
+        self,
+        entry_ids: Sequence[str],
+        metadata_update: Dict[str, Any],
+    ) -> None:
+        """
+        Merge the same metadata update into several entries within one transaction.
+        """
+        if not metadata_update:
+            return
+        targets = [str(entry_id) for entry_id in entry_ids if entry_id]
+        if not targets:
+            return
 
-            current_metadata = deserialize_metadata(row["metadata"])
-            # Only update if there are changes
-            changed = False
-            for k, v in metadata_update.items():
-                if current_metadata.get(k) != v:
-                    current_metadata[k] = v
-                    changed = True
+        with self._locked_cursor(commit=True) as cursor:
+            updates: List[Tuple[str, str]] = []
+            rows = cursor.execute(_SQL_SELECT_METADATA_BY_IDS, (serialize_values(targets),))
+            for entry_id, prompt, raw_metadata in rows.fetchall():
+                current_metadata = deserialize_metadata(raw_metadata)
+                # Only update if there are changes
+                changed = False
+                for k, v in metadata_update.items():
+                    if current_metadata.get(k) != v:
+                        current_metadata[k] = v
+                        changed = True
+                if changed:
+                    serialized_metadata = serialize_metadata(current_metadata)
+                    updates.append(
+                        (
+                            serialized_metadata,
+                            _content_hash(prompt, serialized_metadata),
+                            entry_id,
+                        )
+                    )
 
-            if changed:
-                cursor.execute(
-                    "UPDATE prompt_history SET metadata = ? WHERE id = ?",
-                    (serialize_metadata(current_metadata), entry_id),
-                )
+            if updates:
+                cursor.executemany(_SQL_UPDATE_METADATA, updates)
 
-    def list(self, limit: Optional[int] = None) -> List[PromptHistoryEntry]:
+    def list(
+        self,
+        limit: Optional[int] = None,
+        *,
+        after: Optional[str] = None,
+    ) -> List[PromptHistoryEntry]:
         """
         Return stored entries grouped by prompt text, ordered by recent use.
+        Pass encode_list_cursor() of a page's final entry as `after` to fetch the next
+        one; a malformed cursor raises ValueError.
         """
-        sql = (
-            "SELECT id, created_at, last_used_at, prompt, metadata "
-            "FROM ("
-            "SELECT id, created_at, last_used_at, prompt, metadata, "
-            "ROW_NUMBER() OVER ("
-            "PARTITION BY prompt "
-            "ORDER BY last_used_at DESC, created_at DESC, id DESC"
-            ") AS row_rank "
-            "FROM prompt_history"
-            ") "
-            "WHERE row_rank = 1 "
-            "ORDER BY last_used_at DESC, created_at DESC"
-        )
+        return list(self.iter_entries(limit, after=after))
+
+    def iter_entries(
+        self,
+        limit: Optional[int] = None,
+        *,
+        after: Optional[str] = None,
+    ) -> Iterator[PromptHistoryEntry]:
+        """
+        Yield the entries of list() as rows stream from SQLite.
+        A pooled read connection (and its snapshot) is held until the iterator is exhausted
+        or closed, so consume it promptly.
+        """
+        params: List[Any] = []
+        if after is not None:
+            params.extend(_decode_list_cursor(after))
         if limit is not None:
-            sql += " LIMIT ?"
-            params = (limit,)
-        else:
-            params = ()
-        with self._locked_cursor() as cursor:
-            rows = cursor.execute(sql, params).fetchall()
-            prompts = [row["prompt"] for row in rows]
-            outputs_map = self._fetch_outputs_by_prompt(cursor, prompts) if prompts else {}
-            entry_ids = {
-                record.get("entry_id")
-                for records in outputs_map.values()
-                for record in records
-                if isinstance(record, dict) and record.get("entry_id")
+            params.append(limit)
+        sql = _SQL_LIST_VARIANTS[(after is not None, limit is not None)]
+        with self._read_cursor() as cursor:
+            cursor.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(_LIST_FETCH_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    yield self._entry_from_list_row(row)
+
+    @staticmethod
+    def _entry_from_list_row(row: Tuple[Any, ...]) -> PromptHistoryEntry:
+        (
+            entry_id,
+            created_at,
+            last_used_at,
+            prompt,
+            raw_metadata,
+            files_json,
+            entry_metadata_json,
+        ) = row
+        metadata = deserialize_metadata(raw_metadata)
+        entry_metadata = deserialize_metadata(entry_metadata_json)
+        if entry_metadata:
+            metadata["_phg_entry_metadata"] = {
+                sibling_id: deserialize_metadata(raw) for sibling_id, raw in entry_metadata.items()
             }
-            metadata_map = (
-                self._fetch_metadata_by_entry_ids(cursor, sorted(entry_ids)) if entry_ids else {}
-            )
-        entries: List[PromptHistoryEntry] = []
-        for row in rows:
-            files = tuple(outputs_map.get(row["prompt"], []))
-            entry = PromptHistoryEntry.from_row(row, files)
-            if metadata_map and files:
-                prompt_entry_ids = {
-                    record.get("entry_id")
-                    for record in files
-                    if isinstance(record, dict) and record.get("entry_id")
-                }
-                if prompt_entry_ids:
-                    entry.metadata["_phg_entry_metadata"] = {
-                        entry_id: metadata_map[entry_id]
-                        for entry_id in prompt_entry_ids
-                        if entry_id in metadata_map
-                    }
-            entries.append(entry)
-        return entries
+        return PromptHistoryEntry(
+            id=entry_id,
+            created_at=created_at,
+            prompt=prompt,
+            metadata=metadata,
+            last_used_at=last_used_at,
+            files=tuple(deserialize_records(files_json)),
+        )
 
     def add_outputs_for_entries(
         self,
@@ -294,119 +595,42 @@ class PromptHistoryStorage:
         if not targets:
             return
 
+        rows = [
+            (entry_id, item.filename, item.subfolder, item.type)
+            for entry_id in targets
+            for item in normalized
+        ]
         with self._locked_cursor(commit=True) as cursor:
-            for entry_id in targets:
-                for item in normalized:
-                    cursor.execute(
-                        """
-                        INSERT OR IGNORE INTO prompt_history_output
-                            (entry_id, filename, subfolder, type)
-                        VALUES
-                            (:entry_id, :filename, :subfolder, :type)
-                        """,
-                        {
-                            "entry_id": entry_id,
-                            "filename": item.filename,
-                            "subfolder": item.subfolder,
-                            "type": item.type,
-                        },
-                    )
+            cursor.executemany(_SQL_INSERT_OUTPUT, rows)
 
     def touch_entries(self, entry_ids: Sequence[str]) -> None:
-        targets = [str(entry_id) for entry_id in entry_ids if entry_id]
+        targets = list(dict.fromkeys(str(entry_id) for entry_id in entry_ids if entry_id))
         if not targets:
             return
-        timestamp = datetime.now(timezone.utc).isoformat()
+        timestamp = _utc_now_iso()
         with self._locked_cursor(commit=True) as cursor:
-            cursor.executemany(
-                "UPDATE prompt_history SET last_used_at = ? WHERE id = ?",
-                [(timestamp, entry_id) for entry_id in targets],
-            )
+            cursor.execute(_SQL_TOUCH_BY_IDS, (timestamp, serialize_values(targets)))
 
     def find_entry_ids_for_prompts(self, prompts: Sequence[str]) -> Dict[str, str]:
         candidates = [str(p) for p in prompts if isinstance(p, str) and p]
         if not candidates:
             return {}
 
-        placeholders = ",".join(["?"] * len(candidates))
-        sql = (
-            "SELECT prompt, id FROM prompt_history WHERE prompt IN ("
-            + placeholders
-            + ") ORDER BY last_used_at DESC, created_at DESC"
-        )
-
-        with self._locked_cursor() as cursor:
-            rows = cursor.execute(sql, tuple(candidates)).fetchall()
-
         mapping: Dict[str, str] = {}
-        for row in rows:
-            prompt = row["prompt"]
-            if prompt not in mapping:
-                mapping[prompt] = row["id"]
+        with self._read_cursor() as cursor:
+            rows = cursor.execute(_SQL_LATEST_IDS_FOR_PROMPTS, (serialize_values(candidates),))
+            for prompt, entry_id in rows:
+                mapping[prompt] = entry_id
 
         return mapping
 
-    def _fetch_outputs_by_prompt(
-        self, cursor: sqlite3.Cursor, prompts: Sequence[str]
-    ) -> Dict[str, List[Dict[str, Any]]]:
-        if not prompts:
-            return {}
-
-        outputs: Dict[str, List[OutputRecord]] = {prompt: [] for prompt in prompts}
-        chunk_size = 900
-
-        for chunk in _chunked(prompts, chunk_size):
-            placeholders = ",".join(["?"] * len(chunk))
-            sql = (
-                "SELECT p.prompt, o.entry_id, o.filename, o.subfolder, o.type "
-                "FROM prompt_history_output o "
-                "JOIN prompt_history p ON p.id = o.entry_id "
-                f"WHERE p.prompt IN ({placeholders}) ORDER BY o.id"
-            )
-            rows = cursor.execute(sql, tuple(chunk)).fetchall()
-            for row in rows:
-                prompt = row["prompt"]
-                record: Dict[str, Any] = {"filename": row["filename"]}
-                if row["subfolder"]:
-                    record["subfolder"] = row["subfolder"]
-                if row["type"]:
-                    record["type"] = row["type"]
-                if row["entry_id"]:
-                    record["entry_id"] = row["entry_id"]
-                outputs.setdefault(prompt, []).append(record)
-
-        return outputs
-
-    def _fetch_metadata_by_entry_ids(
-        self, cursor: sqlite3.Cursor, entry_ids: Sequence[str]
-    ) -> Dict[str, Dict[str, Any]]:
-        if not entry_ids:
-            return {}
-
-        metadata_map: Dict[str, Dict[str, Any]] = {}
-        chunk_size = 900
-
-        for chunk in _chunked(entry_ids, chunk_size):
-            placeholders = ",".join(["?"] * len(chunk))
-            sql = f"SELECT id, metadata FROM prompt_history WHERE id IN ({placeholders})"
-            rows = cursor.execute(sql, tuple(chunk)).fetchall()
-            for row in rows:
-                metadata_map[row["id"]] = deserialize_metadata(row["metadata"])
-
-        return metadata_map
-
     def delete(self, entry_id: str) -> bool:
         """
         Delete all entries matching the prompt for the supplied entry id.
         Returns True if any rows were removed.
         """
         with self._locked_cursor(commit=True) as cursor:
-            row = cursor.execute(
-                "SELECT prompt FROM prompt_history WHERE id = ?", (entry_id,)
-            ).fetchone()
-            if not row:
-                return False
-            cursor.execute("DELETE FROM prompt_history WHERE prompt = ?", (row["prompt"],))
+            cursor.execute(_SQL_DELETE_PROMPT_OF_ENTRY, (entry_id,))
             return cursor.rowcount > 0
 
     def clear(self) -> None:
@@ -417,13 +641,52 @@ class PromptHistoryStorage:
             cursor.execute("DELETE FROM prompt_history_output")
             cursor.execute("DELETE FROM prompt_history")
 
+    def close(self) -> None:
+        """
+        Optimize and close every connection. Later reads and writes raise
+        sqlite3.ProgrammingError; closing again is a no-op.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            _OPEN_STORAGES.discard(self)
+            self._optimize()
+            self._closed = True
+            self._connection.close()
+        while True:
+            try:
+                self._read_pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+    @staticmethod
+    def _configure_connection(connection: sqlite3.Connection, *, writer: bool) -> None:
+        """
+        Apply per-connection tuning. Runs outside any transaction, which journal_mode
+        and mmap_size require.
+        """
+        if writer and connection.execute("PRAGMA page_count;").fetchone()[0] == 0:
+            connection.execute(f"PRAGMA page_size={_NEW_DATABASE_PAGE_SIZE};")
+        for pragma in _WRITER_PRAGMAS if writer else _READER_PRAGMAS:
+            connection.execute(pragma)
+        for pragma in _CONNECTION_PRAGMAS:
+            connection.execute(pragma)
+
+    def _optimize(self) -> None:
+        """
+        Let SQLite refresh planner statistics that went stale during this session.
+        """
+        with self._lock:
+            try:
+                self._connection.execute("PRAGMA optimize;")
+            except sqlite3.Error:
+                LOGGER.debug("PRAGMA optimize failed.", exc_info=True)
+
     def _configure_database(self) -> None:
         """
         Initialize SQLite with the required schema.
         """
         with self._locked_cursor(commit=True) as cursor:
-            cursor.execute("PRAGMA journal_mode=WAL;")
-            cursor.execute("PRAGMA synchronous=NORMAL;")
             cursor.execute(
                 """
                 CREATE TABLE IF NOT EXISTS prompt_history (
@@ -447,6 +710,33 @@ class PromptHistoryStorage:
                     SET last_used_at = COALESCE(last_used_at, created_at)
                     """
                 )
+            if "content_hash" not in existing_columns:
+                cursor.execute("ALTER TABLE prompt_history ADD COLUMN content_hash TEXT")
+            # Backfill rows written before the column existed; re-serializing makes
+            # older JSON layouts hash identically to freshly written metadata.
+            legacy_rows = cursor.execute(
+                "SELECT id, prompt, metadata FROM prompt_history WHERE content_hash IS NULL"
+            ).fetchall()
+            if legacy_rows:
+                cursor.executemany(
+                    "UPDATE prompt_history SET content_hash = ? WHERE id = ?",
+                    [
+                        (
+                            _content_hash(
+                                row["prompt"],
+                                serialize_metadata(deserialize_metadata(row["metadata"])),
+                            ),
+                            row["id"],
+                        )
+                        for row in legacy_rows
+                    ],
+                )
+            cursor.execute(
+                """
+                CREATE INDEX IF NOT EXISTS idx_prompt_history_content_hash
+                ON prompt_history (content_hash)
+                """
+            )
             cursor.execute(
                 """
                 CREATE TABLE IF NOT EXISTS prompt_history_output (
@@ -467,6 +757,23 @@ class PromptHistoryStorage:
                 """
             )
             cursor.execute("DROP INDEX IF EXISTS idx_prompt_history_prompt_unique")
+            # Serves the prompt lookups in find_entry_ids_for_prompts and the per-prompt
+            # grouping in list() as index seeks in recency order.
+            cursor.execute(
+                """
+                CREATE INDEX IF NOT EXISTS idx_prompt_history_prompt
+                ON prompt_history (prompt, last_used_at DESC, created_at DESC)
+                """
+            )
+            # Databases never analyzed get a baseline ANALYZE (cheap while the tables are
+            # small); _optimize keeps the statistics current afterwards. The check is on
+            # sqlite_stat1 existing: ANALYZE writes no rows for empty tables, so gating on
+            # its contents would re-run it on every start.
+            has_stats = cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'"
+            ).fetchone()
+            if has_stats is None:
+                cursor.execute("ANALYZE;")
 
 
 _STORAGE_INSTANCE: Optional[PromptHistoryStorage] = None
@@ -0,0 +1,35 @@
+"""
+Shared fixtures. The package is imported outside ComfyUI, so the one runtime module
+the node imports at load time is provided as a minimal stand-in when missing.
+"""
+
+from __future__ import annotations
+
+import sys
+import types
+
+import pytest
+
+try:
+    import comfy_execution.utils  # noqa: F401
+except ImportError:
+    _comfy_execution = types.ModuleType("comfy_execution")
+    _comfy_execution_utils = types.ModuleType("comfy_execution.utils")
+    _comfy_execution_utils.get_executing_context = lambda: None
+    _comfy_execution.utils = _comfy_execution_utils
+    sys.modules.setdefault("comfy_execution", _comfy_execution)
+    sys.modules.setdefault("comfy_execution.utils", _comfy_execution_utils)
+
+from prompt_history_gallery.storage import PromptHistoryStorage  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return tmp_path / "prompt_history.db"
+
+
+@pytest.fixture
+def storage(db_path):
+    storage = PromptHistoryStorage(db_path)
+    yield storage
+    storage.close()
@@ -0,0 +1,178 @@
+"""Tests for the SQLite-backed prompt history storage."""
+
+from __future__ import annotations
+
+import gc
+import sqlite3
+import weakref
+
+import pytest
+
+from prompt_history_gallery.storage import PromptHistoryStorage, encode_list_cursor
+
+
+def test_interrupted_write_block_rolls_back(storage, db_path):
+    with pytest.raises(KeyboardInterrupt):
+        with storage._locked_cursor(commit=True):
+            storage.append("lost")
+            raise KeyboardInterrupt
+
+    generation = storage.generation
+    storage.append("kept")
+
+    assert storage.generation == generation + 1
+    assert [entry.prompt for entry in storage.list()] == ["kept"]
+    connection = sqlite3.connect(db_path)
+    try:
+        rows = connection.execute("SELECT prompt FROM prompt_history").fetchall()
+    finally:
+        connection.close()
+    assert rows == [("kept",)]
+
+
+def _pages(storage, limit):
+    pages, after = [], None
+    while True:
+        page = storage.list(limit, after=after)
+        if not page:
+            return pages
+        pages.append([entry.prompt for entry in page])
+        after = encode_list_cursor(page[-1])
+
+
+def test_list_pages_do_not_skip_entries_with_tied_timestamps(storage):
+    entries = [storage.append(f"p{index}") for index in range(1, 6)]
+    # One batch touch gives every entry but the newest the same last_used_at.
+    storage.touch_entries([entry.id for entry in entries[:4]])
+
+    pages = _pages(storage, 2)
+
+    assert [prompt for page in pages for prompt in page] == [
+        entry.prompt for entry in storage.list()
+    ]
+    assert sorted(prompt for page in pages for prompt in page) == ["p1", "p2", "p3", "p4", "p5"]
+
+
+def test_list_rejects_malformed_cursor(storage):
+    storage.append("p1")
+    with pytest.raises(ValueError):
+        storage.list(2, after="not-a-cursor")
+
+
+def test_unclosed_storage_is_not_kept_alive(db_path):
+    storage = PromptHistoryStorage(db_path)
+    ref = weakref.ref(storage)
+    del storage
+    gc.collect()
+    assert ref() is None
+
+
+def test_reopening_empty_database_skips_analyze(db_path, monkeypatch):
+    PromptHistoryStorage(db_path).close()
+    statements = []
+    connect = sqlite3.connect
+
+    def traced_connect(*args, **kwargs):
+        connection = connect(*args, **kwargs)
+        connection.set_trace_callback(statements.append)
+        return connection
+
+    monkeypatch.setattr(sqlite3, "connect", traced_connect)
+    PromptHistoryStorage(db_path).close()
+    assert "ANALYZE;" not in statements
+
+
+def test_touch_after_touching_another_entry_restores_recency(storage):
+    first = storage.append("A")
+    second = storage.append("B")
+
+    storage.touch_entries([first.id])
+    storage.touch_entries([second.id])
+    storage.touch_entries([first.id])
+
+    assert [entry.prompt for entry in storage.list()] == ["A", "B"]
+
+
+def test_closed_storage_rejects_reads_and_writes(db_path):
+    storage = PromptHistoryStorage(db_path)
+    storage.append("p1")
+    storage.close()
+    storage.close()
+
+    with pytest.raises(sqlite3.ProgrammingError):
+        storage.list()
+    with pytest.raises(sqlite3.ProgrammingError):
+        storage.append("p2")
+
+
+def _seed_listing(storage):
+    """Two entries share the prompt "cat"; "dog" has one entry and no outputs."""
+    first, _ = storage.ensure_entry("cat", metadata={"seed": 1})
+    second, _ = storage.ensure_entry("cat", metadata={"seed": 2})
+    dog, _ = storage.ensure_entry("dog")
+    storage.add_outputs_for_entries(
+        [first.id], [{"filename": "a.png", "subfolder": "x", "type": "output"}]
+    )
+    storage.add_outputs_for_entries([second.id], ["b.png"])
+    storage.add_outputs_for_entries([first.id], [{"filename": "c.png", "type": "temp"}])
+    storage.touch_entries([first.id])
+    return first, second, dog
+
+
+def test_list_returns_latest_entry_per_prompt_with_shared_files(storage):
+    first, second, dog = _seed_listing(storage)
+
+    listed = [entry.to_dict() for entry in storage.list()]
+
+    assert listed == [
+        {
+            "id": first.id,
+            "created_at": first.created_at,
+            "prompt": "cat",
+            "metadata": {
+                "seed": 1,
+                "_phg_entry_metadata": {first.id: {"seed": 1}, second.id: {"seed": 2}},
+            },
+            "last_used_at": listed[0]["last_used_at"],
+            # Every entry of the prompt contributes, in insertion order; empty keys are dropped.
+            "files": [
+                {"filename": "a.png", "subfolder": "x", "type": "output", "entry_id": first.id},
+                {"filename": "b.png", "entry_id": second.id},
+                {"filename": "c.png", "type": "temp", "entry_id": first.id},
+            ],
+        },
+        {
+            "id": dog.id,
+            "created_at": dog.created_at,
+            "prompt": "dog",
+            "metadata": {},
+            "last_used_at": dog.last_used_at,
+            "files": [],
+        },
+    ]
+    assert listed[0]["last_used_at"] > dog.last_used_at
+
+
+def test_list_switches_to_the_most_recently_used_entry(storage):
+    first, second, _ = _seed_listing(storage)
+    storage.touch_entries([second.id])
+
+    latest = storage.list()[0]
+
+    assert latest.id == second.id
+    assert latest.metadata["seed"] == 2
+    assert set(latest.metadata["_phg_entry_metadata"]) == {first.id, second.id}
+
+
+def test_list_limit_and_cursor_pages_match_full_listing(storage):
+    entries = [storage.append(f"p{index}") for index in range(5)]
+    storage.touch_entries([entries[1].id])
+
+    full = [entry.id for entry in storage.list()]
+    assert full == [entries[i].id for i in (1, 4, 3, 2, 0)]
+    assert [entry.id for entry in storage.list(2)] == full[:2]
+
+    second_page = storage.list(2, after=encode_list_cursor(storage.list(2)[-1]))
+    assert [entry.id for entry in second_page] == full[2:4]
+    last_page = storage.list(2, after=encode_list_cursor(second_page[-1]))
+    assert [entry.id for entry in last_page] == full[4:]
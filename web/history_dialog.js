@@ -34,6 +34,18 @@ const HISTORY_LIMIT_MIN = 20;
 const HISTORY_LIMIT_MAX = 1000;
 const HISTORY_WIDGET_FLAG = "__phg_history_widget__";
 const HISTORY_WIDGET_LABEL = "⏱ History";
+const SEARCH_TERM_SPLIT_RE = /[\s,]+/;
+// Lowercased prompt text per entry object; refreshed entries arrive as new objects.
+const lowercasePromptCache = new WeakMap();
+
+function lowercasePrompt(entry) {
+  let text = lowercasePromptCache.get(entry);
+  if (text === undefined) {
+    text = String(entry.prompt ?? "").toLowerCase();
+    lowercasePromptCache.set(entry, text);
+  }
+  return text;
+}
 
 const TEXT = {
   title: "Prompt History",
@@ -986,14 +998,11 @@ class HistoryDialog {
     if (!Array.isArray(entries) || !entries.length) return [];
     const query = (this.state.searchQuery ?? "").trim().toLowerCase();
     if (!query) return entries;
-    const terms = query
-      .split(/[\s,]+/)
-      .map((term) => term.trim())
-      .filter(Boolean);
+    const terms = query.split(SEARCH_TERM_SPLIT_RE).filter(Boolean);
     if (!terms.length) return entries;
     const isOrMode = this.state.searchMode === "or";
     return entries.filter((entry) => {
-      const promptText = String(entry.prompt ?? "").toLowerCase();
+      const promptText = lowercasePrompt(entry);
       const matchesTerm = (term) => promptText.includes(term);
       return isOrMode ? terms.some(matchesTerm) : terms.every(matchesTerm);
     });
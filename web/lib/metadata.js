@@ -1,37 +1,46 @@
+// Parsed params keyed by the metadata object; refreshed entries arrive as new objects.
+const extractedParamsCache = new WeakMap();
+
 export function extractMetadata(entry) {
   if (!entry) return {};
 
+  // Generation params only come from the metadata object; anything else yields none.
+  const metadata = entry.metadata;
+  if (metadata === null || typeof metadata !== "object") return {};
+
+  const cached = extractedParamsCache.get(metadata);
+  if (cached) return { ...cached };
+
+  const params = parseMetadata(metadata);
+  extractedParamsCache.set(metadata, params);
+  return { ...params };
+}
+
+function parseMetadata(metadata) {
   const params = {};
 
   let promptData = null;
+  if (metadata.comfyui_prompt) {
+    promptData = metadata.comfyui_prompt;
+  } else if (metadata.prompt) {
+    try {
+      promptData =
+        typeof metadata.prompt === "string" ? JSON.parse(metadata.prompt) : metadata.prompt;
+    } catch (e) {}
+  }
+
+  let workflowData = null;
+  if (metadata.comfyui_workflow) {
+    workflowData = metadata.comfyui_workflow;
+  } else if (metadata.workflow) {
+    try {
+      workflowData =
+        typeof metadata.workflow === "string" ? JSON.parse(metadata.workflow) : metadata.workflow;
+    } catch (e) {}
+  }
 
-  if (entry.metadata) {
-    if (entry.metadata.comfyui_prompt) {
-      promptData = entry.metadata.comfyui_prompt;
-    } else if (entry.metadata.prompt) {
-      try {
-        promptData =
-          typeof entry.metadata.prompt === "string"
-            ? JSON.parse(entry.metadata.prompt)
-            : entry.metadata.prompt;
-      } catch (e) {}
-    }
-
-    let workflowData = null;
-    if (entry.metadata.comfyui_workflow) {
-      workflowData = entry.metadata.comfyui_workflow;
-    } else if (entry.metadata.workflow) {
-      try {
-        workflowData =
-          typeof entry.metadata.workflow === "string"
-            ? JSON.parse(entry.metadata.workflow)
-            : entry.metadata.workflow;
-      } catch (e) {}
-    }
-
-    if (workflowData) {
-      extractFromWorkflow(workflowData, params);
-    }
+  if (workflowData) {
+    extractFromWorkflow(workflowData, params);
   }
 
   if (promptData) {
@@ -41,50 +50,97 @@ export function extractMetadata(entry) {
   return params;
 }
 
+function applyPromptText(text, params) {
+  if (!params.prompt) {
+    params.prompt = text;
+  } else if (text !== params.prompt) {
+    params.negative_prompt = text;
+  }
+}
+
+function readSamplerWidgets(widgets, params) {
+  if (widgets.length >= 4) {
+    if (typeof widgets[0] === "number") params.seed = widgets[0];
+    if (typeof widgets[1] === "number") params.steps = widgets[1];
+    if (typeof widgets[2] === "number") params.cfg = widgets[2];
+    if (typeof widgets[3] === "string") params.sampler = widgets[3];
+    if (widgets.length > 4 && typeof widgets[4] === "string") params.scheduler = widgets[4];
+  }
+}
+
+function readCheckpointWidgets(widgets, params) {
+  if (widgets[0] && typeof widgets[0] === "string") params.model = widgets[0];
+}
+
+function readLatentWidgets(widgets, params) {
+  if (widgets.length >= 2) {
+    if (typeof widgets[0] === "number") params.width = widgets[0];
+    if (typeof widgets[1] === "number") params.height = widgets[1];
+  }
+}
+
+function readTextEncodeWidgets(widgets, params) {
+  if (widgets[0] && typeof widgets[0] === "string") applyPromptText(widgets[0], params);
+}
+
+// Workflow node type -> handler(widgets_values, params).
+const WORKFLOW_HANDLERS = new Map([
+  ["KSampler", readSamplerWidgets],
+  ["KSamplerAdvanced", readSamplerWidgets],
+  ["CheckpointLoader", readCheckpointWidgets],
+  ["CheckpointLoaderSimple", readCheckpointWidgets],
+  ["CheckpointLoader|pysssss", readCheckpointWidgets],
+  ["EmptyLatentImage", readLatentWidgets],
+  ["CLIPTextEncode", readTextEncodeWidgets],
+]);
+
 function extractFromWorkflow(workflow, params) {
   if (!workflow || !workflow.nodes) return;
 
   for (const node of workflow.nodes) {
-    const type = node.type;
+    const handler = WORKFLOW_HANDLERS.get(node.type);
+    if (!handler) continue;
     const widgets = node.widgets_values;
-
     if (!widgets) continue;
-
-    if (["KSampler", "KSamplerAdvanced"].includes(type)) {
-      if (widgets.length >= 4) {
-        if (typeof widgets[0] === "number") params.seed = widgets[0];
-        if (typeof widgets[1] === "number") params.steps = widgets[1];
-        if (typeof widgets[2] === "number") params.cfg = widgets[2];
-        if (typeof widgets[3] === "string") params.sampler = widgets[3];
-        if (widgets.length > 4 && typeof widgets[4] === "string") params.scheduler = widgets[4];
-      }
-    } else if (
-      type === "CheckpointLoader" ||
-      type === "CheckpointLoaderSimple" ||
-      type === "CheckpointLoader|pysssss"
-    ) {
-      if (widgets[0] && typeof widgets[0] === "string") params.model = widgets[0];
-    } else if (type === "CheckpointLoader") {
-      // CheckpointLoader has config_name at 0, ckpt_name at 1
-      if (widgets[1] && typeof widgets[1] === "string") params.model = widgets[1];
-    } else if (type === "EmptyLatentImage") {
-      if (widgets.length >= 2) {
-        if (typeof widgets[0] === "number") params.width = widgets[0];
-        if (typeof widgets[1] === "number") params.height = widgets[1];
-      }
-    } else if (type === "CLIPTextEncode") {
-      if (widgets[0] && typeof widgets[0] === "string") {
-        const text = widgets[0];
-        if (!params.prompt) {
-          params.prompt = text;
-        } else if (text !== params.prompt) {
-          params.negative_prompt = text;
-        }
-      }
-    }
+    handler(widgets, params);
   }
 }
 
+function readCheckpointInputs(inputs, params) {
+  const model = inputs.ckpt_name || inputs.model_name;
+  if (model && typeof model === "string") params.model = model;
+}
+
+function readSamplerInputs(inputs, params) {
+  if (typeof inputs.seed === "number" || typeof inputs.seed === "string") params.seed = inputs.seed;
+  if (typeof inputs.steps === "number") params.steps = inputs.steps;
+  if (typeof inputs.cfg === "number") params.cfg = inputs.cfg;
+  if (typeof inputs.sampler_name === "string") params.sampler = inputs.sampler_name;
+  if (typeof inputs.scheduler === "string") params.scheduler = inputs.scheduler;
+  if (typeof inputs.denoise === "number" && inputs.denoise !== 1.0) params.denoise = inputs.denoise;
+}
+
+function readLatentInputs(inputs, params) {
+  if (typeof inputs.width === "number") params.width = inputs.width;
+  if (typeof inputs.height === "number") params.height = inputs.height;
+  if (typeof inputs.batch_size === "number") params.batch_size = inputs.batch_size;
+}
+
+function readTextEncodeInputs(inputs, params) {
+  if (inputs.text && typeof inputs.text === "string") applyPromptText(inputs.text, params);
+}
+
+// Prompt class_type -> handler(inputs, params).
+const PROMPT_HANDLERS = new Map([
+  ["CheckpointLoader", readCheckpointInputs],
+  ["CheckpointLoaderSimple", readCheckpointInputs],
+  ["CheckpointLoader|pysssss", readCheckpointInputs],
+  ["KSampler", readSamplerInputs],
+  ["KSamplerAdvanced", readSamplerInputs],
+  ["EmptyLatentImage", readLatentInputs],
+  ["CLIPTextEncode", readTextEncodeInputs],
+]);
+
 function extractFromPrompt(prompt, params) {
   if (!prompt) return;
 
@@ -92,39 +148,8 @@ function extractFromPrompt(prompt, params) {
     const node = prompt[key];
     if (!node) continue;
 
-    const classType = node.class_type;
-    const inputs = node.inputs || {};
-
-    if (
-      classType === "CheckpointLoader" ||
-      classType === "CheckpointLoaderSimple" ||
-      classType === "CheckpointLoader|pysssss"
-    ) {
-      const model = inputs.ckpt_name || inputs.model_name;
-      if (model && typeof model === "string") params.model = model;
-    } else if (["KSampler", "KSamplerAdvanced"].includes(classType)) {
-      if (typeof inputs.seed === "number" || typeof inputs.seed === "string")
-        params.seed = inputs.seed;
-      if (typeof inputs.steps === "number") params.steps = inputs.steps;
-      if (typeof inputs.cfg === "number") params.cfg = inputs.cfg;
-      if (typeof inputs.sampler_name === "string") params.sampler = inputs.sampler_name;
-      if (typeof inputs.scheduler === "string") params.scheduler = inputs.scheduler;
-      if (typeof inputs.denoise === "number" && inputs.denoise !== 1.0)
-        params.denoise = inputs.denoise;
-    } else if (classType === "EmptyLatentImage") {
-      if (typeof inputs.width === "number") params.width = inputs.width;
-      if (typeof inputs.height === "number") params.height = inputs.height;
-      if (typeof inputs.batch_size === "number") params.batch_size = inputs.batch_size;
-    } else if (classType === "CLIPTextEncode") {
-      if (inputs.text && typeof inputs.text === "string") {
-        const text = inputs.text;
-        if (!params.prompt) {
-          params.prompt = text;
-        } else if (text !== params.prompt) {
-          params.negative_prompt = text;
-        }
-      }
-    }
+    const handler = PROMPT_HANDLERS.get(node.class_type);
+    if (handler) handler(node.inputs || {}, params);
   }
 }
 